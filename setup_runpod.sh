@@ -17,7 +17,7 @@ echo "=========================================="
 
 # 1. Update system
 echo "[1/8] Updating system..."
-apt update && apt install -y python3.11 python3.11-venv python3.11-dev git curl
+apt update && apt install -y python3.11 python3.11-venv python3.11-dev git curl ffmpeg
 
 # 2. Create Python 3.11 virtual environment
 echo "[2/8] Creating Python 3.11 environment..."
@@ -27,7 +27,7 @@ source /workspace/hotline-env/bin/activate
 # 3. Install Python dependencies
 echo "[3/8] Installing Python dependencies..."
 pip install --upgrade pip
-pip install TTS flask flask-cors requests huggingface_hub
+pip install TTS flask flask-cors requests httpx orjson gunicorn huggingface_hub
 
 # 4. Clone the repository
 echo "[4/8] Cloning repository..."
@@ -49,7 +49,7 @@ curl -fsSL https://ollama.com/install.sh | sh
 
 # 7. Pull Llama 3.1
 echo "[7/8] Pulling Llama 3.1 model..."
-ollama serve &
+OLLAMA_NUM_PARALLEL=4 OLLAMA_KEEP_ALIVE=30m ollama serve &
 sleep 5
 ollama pull llama3.1:8b
 
@@ -65,7 +65,7 @@ echo ""
 echo "To start all services, run:"
 echo ""
 echo "  # Terminal 1: Start Ollama"
-echo "  ollama serve"
+echo "  OLLAMA_NUM_PARALLEL=4 OLLAMA_KEEP_ALIVE=30m ollama serve"
 echo ""
 echo "  # Terminal 2: Start TTS Server (port 5000)"
 echo "  source /workspace/hotline-env/bin/activate"
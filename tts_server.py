@@ -17,8 +17,18 @@ import os
 import io
 import json
 import wave
-import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import torch
+import torch.nn.functional as F
+from torch.nn.utils.rnn import pad_sequence
+from transformers.pytorch_utils import Conv1D
 from flask import Flask, request, jsonify, send_file, send_from_directory
 from TTS.api import TTS
 
@@ -28,49 +38,733 @@ app = Flask(__name__)
 MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:8b")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")  # "ollama" or "llamacpp" (llama.cpp llama-server)
+LLAMACPP_URL = os.getenv("LLAMACPP_URL", "http://localhost:8081")
 DEFAULT_SPEAKER = os.path.join(MODEL_DIR, "samples", "en_sample.wav")
-
-# Initialize TTS model (lazy loading)
+XTTS_DEVICE = os.getenv("XTTS_DEVICE", "cuda" if torch.cuda.is_available() else "cpu")
+XTTS_DTYPE = os.getenv("XTTS_DTYPE", "float16")  # GPT dtype on GPU; on CPU anything but float32 means int8
+XTTS_COMPILE = os.getenv("XTTS_COMPILE", "0") == "1"  # Static KV cache + torch.compile GPT decoding (GPU only)
+MAX_BATCH = int(os.getenv("MAX_BATCH", 8))  # Max sentences per batched forward pass
+MAX_WAIT_MS = int(os.getenv("MAX_WAIT_MS", 20))  # How long an idle pool waits for more sentences to batch
+MAX_SPEAKERS = int(os.getenv("MAX_SPEAKERS", 64))  # Reference voices kept in the speaker table
+THREADS = int(os.getenv("THREADS", 32))  # Concurrent requests served (they share one model and request pool)
+
+# Sentences only batch with others of similar length (characters, a proxy for audio length)
+# so short ones don't wait on long ones. Longer bins use smaller batches.
+BINS = [(0, 40), (40, 120), (120, 400)]
+BIN_BATCH = [MAX_BATCH, max(1, MAX_BATCH // 2), max(1, MAX_BATCH // 4)]
+SENTENCE_GAP = 10000  # Samples of silence between sentences (same as TTS.utils.synthesizer)
+
+# Pooled keep-alive HTTP connections to the LLM server
+SESSION = requests.Session()
+SESSION.headers["Connection"] = "keep-alive"
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"})
+    )
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# Initialize TTS model (loaded and warmed when the gunicorn worker starts, see preload_tts)
 tts_model = None
+request_pool = None
+_tts_lock = threading.Lock()
+tts_ready = threading.Event()  # Set once the model is loaded and warmed up
+_scratch = threading.local()
 
-def get_tts():
-    """Lazy load TTS model."""
-    global tts_model
-    if tts_model is None:
-        print("Loading XTTS-v2 model...")
-        tts_model = TTS(
-            model_path=MODEL_DIR,
-            config_path=os.path.join(MODEL_DIR, "config.json"),
-            gpu=False  # Set to True if you have CUDA
+
+def length_bin(text: str) -> int:
+    """Index of the BINS entry for a sentence, by character count."""
+    for idx, (_, upper) in enumerate(BINS):
+        if len(text) < upper:
+            return idx
+    return len(BINS) - 1
+
+
+class PoolItem:
+    """A single sentence in the request pool, carrying its per-module state."""
+
+    __slots__ = ("text", "language", "bin", "speaker", "module_idx",
+                 "enc_out", "gpt_state", "vocoder_state", "future")
+
+    def __init__(self, text: str, language: str, speaker: int):
+        self.text = text
+        self.language = language
+        self.bin = length_bin(text)
+        self.speaker = speaker  # Row of the speaker's latents in the SpeakerTable
+        self.module_idx = RequestPool.TEXT_ENCODER
+        self.enc_out = None        # (text_tokens, GPT prefix embedding)
+        self.gpt_state = None      # GPT latents fed to the vocoder
+        self.vocoder_state = None  # Output waveform (float32 numpy)
+        self.future = Future()
+
+
+class SpeakerTable:
+    """
+    Conditioning latents of every known reference voice, stacked into two contiguous device
+    tensors with one row per speaker: gpt_cond_table [N, T_c, D] and spk_emb_table [N, D_s, 1].
+
+    Sentences carry their speaker's row index, so a batch gathers its conditioning with one
+    index_select instead of stacking per-sentence tensors. Rows are keyed by reference wav path
+    and mtime (an edited file is recomputed) and, once the table is full, the least recently
+    used row that no queued sentence references is overwritten.
+    """
+
+    def __init__(self, model, capacity: int):
+        self.model = model
+        self.capacity = capacity
+        self.speaker_ids = OrderedDict()  # (speaker_wav, mtime) -> row, least recently used first
+        self.refs = [0] * capacity        # Sentences in the pool using each row
+        self.loading = {}                 # (speaker_wav, mtime) -> Event set once its latents are stored
+        self.gpt_cond_table = None        # Allocated on first use, once the latent shapes are known
+        self.spk_emb_table = None
+        self.lock = threading.Lock()
+
+    def acquire(self, speaker_wav: str) -> int:
+        """Row for a reference wav, computing its latents on first use. Pair with release()."""
+        key = (speaker_wav, os.path.getmtime(speaker_wav))
+        while True:
+            with self.lock:
+                row = self.speaker_ids.get(key)
+                if row is not None:
+                    self.speaker_ids.move_to_end(key)
+                    self.refs[row] += 1
+                    return row
+                loaded = self.loading.get(key)
+                if loaded is None:
+                    loaded = self.loading[key] = threading.Event()
+                    break
+            # Another request is computing this voice; use its row once stored (or retry if it failed)
+            loaded.wait()
+
+        # Computed without the lock so the pool worker keeps releasing rows meanwhile
+        try:
+            gpt_cond_latent, speaker_embedding = self._latents(key[0])
+            with self.lock:
+                row = self._store(key, gpt_cond_latent, speaker_embedding)
+                self.refs[row] += 1
+            return row
+        finally:
+            with self.lock:
+                del self.loading[key]
+            loaded.set()
+
+    def release(self, row: int):
+        with self.lock:
+            self.refs[row] -= 1
+
+    def _latents(self, speaker_wav: str):
+        model = self.model
+        with _autocast():
+            return model.get_conditioning_latents(
+                audio_path=speaker_wav,
+                gpt_cond_len=model.config.gpt_cond_len,
+                gpt_cond_chunk_len=model.config.gpt_cond_chunk_len,
+                max_ref_length=model.config.max_ref_len,
+                sound_norm_refs=model.config.sound_norm_refs,
+            )
+
+    def _store(self, key, gpt_cond_latent, speaker_embedding) -> int:
+        """Write a speaker's latents into a free or least recently used row. Call with the lock held."""
+        model = self.model
+        if self.gpt_cond_table is None:
+            self.gpt_cond_table = torch.empty(
+                self.capacity, *gpt_cond_latent.shape[1:], dtype=torch.float32, device=model.device
+            )
+            self.spk_emb_table = torch.empty(
+                self.capacity, *speaker_embedding.shape[1:], dtype=torch.float32, device=model.device
+            )
+
+        if len(self.speaker_ids) < self.capacity:
+            row = len(self.speaker_ids)
+        else:
+            stale = next((k for k, r in self.speaker_ids.items() if self.refs[r] == 0), None)
+            if stale is None:
+                raise RuntimeError(f"All {self.capacity} speaker slots are in use")
+            row = self.speaker_ids.pop(stale)
+
+        self.gpt_cond_table[row] = gpt_cond_latent[0]
+        self.spk_emb_table[row] = speaker_embedding[0]
+        self.speaker_ids[key] = row
+        return row
+
+
+class RequestPool:
+    """
+    Instant request pool with module-wise dynamic batching for XTTS-v2.
+
+    Every sentence moves through three modules: text encoder -> GPT decoder -> HiFi-GAN
+    vocoder. A single worker thread runs each module once per iteration over all items
+    currently waiting at that module, so concurrent requests share one batched forward
+    pass per stage instead of running the whole model at batch size 1.
+
+    When new sentences arrive at an idle pool, the worker waits up to MAX_WAIT_MS (or until
+    MAX_BATCH sentences are queued) so concurrent requests start in the same batch. Each
+    batch only holds sentences from one length bin (see BINS). Speaker conditioning is
+    gathered from a shared SpeakerTable.
+    """
+
+    TEXT_ENCODER, GPT_DECODER, VOCODER = range(3)
+
+    def __init__(self, tts):
+        self.model = tts.synthesizer.tts_model
+        self.speakers = SpeakerTable(self.model, MAX_SPEAKERS)
+        self.decoder = None
+        if XTTS_COMPILE:
+            if XTTS_DEVICE.startswith("cuda"):
+                self.decoder = StaticCacheDecoder(self.model.gpt, self.model.config, MAX_BATCH)
+            else:
+                print("XTTS_COMPILE is only supported on GPU, using the default GPT decoder")
+        self.items = []
+        self.error = None  # Set if the worker thread died; new sentences fail fast
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.worker = threading.Thread(target=self._run, name="xtts-request-pool", daemon=True)
+        self.worker.start()
+
+    def submit(self, text: str, language: str, speaker_wav: str) -> Future:
+        """Add a sentence to the pool. The future resolves to its waveform."""
+        item = PoolItem(text, language, self.speakers.acquire(speaker_wav))
+        with self.ready:
+            error = self.error
+            if error is None:
+                self.items.append(item)
+                self.ready.notify()
+        if error is not None:
+            self.speakers.release(item.speaker)
+            item.future.set_exception(RuntimeError(f"Request pool stopped: {error}"))
+        return item.future
+
+    def _run(self):
+        if self.decoder is not None:
+            try:
+                # Compile on this thread: CUDA graphs are recorded per thread
+                with torch.inference_mode(), _autocast():
+                    self.decoder.warmup()
+                print("XTTS_COMPILE step graphs ready")
+            except Exception as e:
+                print(f"XTTS_COMPILE warmup failed, using the default GPT decoder: {e}")
+                self.decoder = None
+        try:
+            self._serve()
+        except BaseException as e:
+            # Fail everything queued so no caller waits on a dead worker
+            print(f"Request pool worker stopped: {e}")
+            with self.lock:
+                self.error = e
+                pending = self.items
+            self._finish(pending, error=e)
+            raise
+
+    def _serve(self):
+        stages = (
+            (self.TEXT_ENCODER, self._encode),
+            (self.GPT_DECODER, self._decode),
+            (self.VOCODER, self._vocode),
         )
-        print("XTTS-v2 model loaded!")
+        while True:
+            with self.ready:
+                self.ready.wait_for(lambda: self.items)
+                if all(item.module_idx == self.TEXT_ENCODER for item in self.items):
+                    self.ready.wait_for(lambda: len(self.items) >= MAX_BATCH, timeout=MAX_WAIT_MS / 1000)
+
+            for module_idx, stage in stages:
+                batch = self._take(module_idx)
+                if not batch:
+                    continue
+                try:
+                    # The vocoder always runs in FP32 to preserve audio quality
+                    with torch.inference_mode(), _autocast(enabled=module_idx != self.VOCODER):
+                        stage(batch)
+                except Exception as e:
+                    print(f"Request pool error: {e}")
+                    self._finish(batch, error=e)
+
+    def _take(self, module_idx):
+        """Items waiting at a module: the oldest one's length bin, up to that bin's batch size."""
+        with self.lock:
+            waiting = [item for item in self.items if item.module_idx == module_idx]
+        if not waiting:
+            return []
+        length_bin = waiting[0].bin
+        return [item for item in waiting if item.bin == length_bin][:BIN_BATCH[length_bin]]
+
+    def _finish(self, batch, error=None):
+        """Remove items from the pool and resolve their futures."""
+        done = set(batch)
+        with self.lock:
+            self.items = [item for item in self.items if item not in done]
+        for item in batch:
+            if item.future.done():
+                continue  # Already failed on its own in an earlier stage
+            self.speakers.release(item.speaker)
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(item.vocoder_state)
+
+    def _encode(self, batch):
+        """Tokenize and embed the batch into GPT prefixes (speaker latents + text)."""
+        model = self.model
+        gpt = model.gpt
+
+        ready = []
+        for item in batch:
+            language = item.language.split("-")[0]  # remove the country code
+            try:
+                tokens = model.tokenizer.encode(item.text.strip().lower(), lang=language)
+                if len(tokens) >= model.args.gpt_max_text_tokens:
+                    raise ValueError("XTTS can only generate text with a maximum of 400 tokens.")
+            except Exception as e:
+                self._finish([item], error=e)
+                continue
+            ready.append((item, torch.IntTensor(tokens)))
+        if not ready:
+            return
+
+        # Right-padded so the learned text positions of every row start at 0
+        text_inputs = pad_sequence(
+            [tokens for _, tokens in ready], batch_first=True, padding_value=gpt.stop_text_token
+        ).to(model.device)
+        text_inputs = F.pad(text_inputs, (0, 1), value=gpt.stop_text_token)
+        text_inputs = F.pad(text_inputs, (1, 0), value=gpt.start_text_token)
+        text_emb = gpt.text_embedding(text_inputs) + gpt.text_pos_embedding(text_inputs)
+
+        speakers = torch.tensor([item.speaker for item, _ in ready], device=model.device)
+        gpt_cond = self.speakers.gpt_cond_table.index_select(0, speakers).to(text_emb.dtype)
+
+        for row, (item, tokens) in enumerate(ready):
+            prefix = torch.cat([gpt_cond[row], text_emb[row, : tokens.shape[0] + 2]], dim=0)
+            item.enc_out = (tokens.unsqueeze(0).to(model.device), prefix)
+            item.module_idx = self.GPT_DECODER
+
+    def _decode(self, batch):
+        """Run autoregressive GPT decoding over left-padded prefixes in one generate call."""
+        prefixes = [item.enc_out[1] for item in batch]
+        prefix_len = max(prefix.shape[0] for prefix in prefixes)
+        prefix_emb = prefixes[0].new_zeros(len(batch), prefix_len, prefixes[0].shape[-1])
+        attention_mask = torch.zeros(len(batch), prefix_len + 1, dtype=torch.long, device=prefix_emb.device)
+        for row, prefix in enumerate(prefixes):
+            prefix_emb[row, prefix_len - prefix.shape[0]:] = prefix
+            attention_mask[row, prefix_len - prefix.shape[0]:] = 1
+
+        if self.decoder is not None:
+            codes = self.decoder.generate(prefix_emb, attention_mask[:, :-1].bool())
+        else:
+            codes = self._hf_generate(prefix_emb, attention_mask)
+
+        for row, item in enumerate(batch):
+            item.gpt_state = self._gpt_latents(item, codes[row])
+            item.module_idx = self.VOCODER
+
+    def _hf_generate(self, prefix_emb, attention_mask):
+        """Decode audio codes with HF generate, the same way Xtts.inference does."""
+        gpt = self.model.gpt
+        config = self.model.config
+
+        # Same fake inputs as GPT.compute_embeddings: prefix placeholders + start_audio_token
+        gpt_inputs = torch.ones_like(attention_mask)
+        gpt_inputs[:, -1] = gpt.start_audio_token
+        gpt.gpt_inference.store_prefix_emb(prefix_emb)
+        codes = gpt.gpt_inference.generate(
+            gpt_inputs,
+            attention_mask=attention_mask,
+            bos_token_id=gpt.start_audio_token,
+            pad_token_id=gpt.stop_audio_token,
+            eos_token_id=gpt.stop_audio_token,
+            max_length=gpt.max_gen_mel_tokens + gpt_inputs.shape[-1],
+            do_sample=True,
+            top_p=config.top_p,
+            top_k=config.top_k,
+            temperature=config.temperature,
+            num_return_sequences=1,
+            num_beams=1,
+            length_penalty=config.length_penalty,
+            repetition_penalty=config.repetition_penalty,
+            output_attentions=False,
+        )
+        return codes[:, gpt_inputs.shape[-1]:]
+
+    def _gpt_latents(self, item, codes):
+        """Compute the GPT latents for one sentence from its generated audio codes."""
+        gpt = self.model.gpt
+        text_tokens, prefix = item.enc_out
+
+        # Keep everything up to and including the first stop token, as unbatched generation does
+        stop = (codes == gpt.stop_audio_token).nonzero()
+        if len(stop):
+            codes = codes[: stop[0, 0] + 1]
+        codes = codes.unsqueeze(0)
+
+        return gpt(
+            text_tokens,
+            torch.tensor([text_tokens.shape[-1]], device=text_tokens.device),
+            codes,
+            torch.tensor([codes.shape[-1] * gpt.code_stride_len], device=text_tokens.device),
+            cond_latents=self.speakers.gpt_cond_table[item.speaker, None].to(prefix.dtype),
+            return_attentions=False,
+            return_latent=True,
+        )
+
+    def _vocode(self, batch):
+        """Run HiFi-GAN once over the right-padded latents and trim each waveform."""
+        decoder = self.model.hifigan_decoder
+
+        latents = pad_sequence([item.gpt_state[0].float() for item in batch], batch_first=True)
+        speakers = torch.tensor([item.speaker for item in batch], device=latents.device)
+        speaker_embedding = self.speakers.spk_emb_table.index_select(0, speakers)
+        wavs = decoder(latents, g=speaker_embedding).reshape(len(batch), -1).float().cpu()
+
+        for row, item in enumerate(batch):
+            item.vocoder_state = wavs[row, : self._output_samples(item.gpt_state.shape[1])].numpy()
+        self._finish(batch)
+
+    def _output_samples(self, frames: int) -> int:
+        """Number of waveform samples HiFi-GAN produces for `frames` GPT latents."""
+        decoder = self.model.hifigan_decoder
+        frames = int(frames * decoder.ar_mel_length_compression / decoder.output_hop_length)
+        frames = int(frames * decoder.output_sample_rate / decoder.input_sample_rate)
+        return frames * decoder.output_hop_length
+
+
+class StaticCacheDecoder(torch.nn.Module):
+    """
+    gpt-fast style decoding loop for the XTTS GPT.
+
+    Keys/values live in a KV cache allocated once for `max_batch` rows and the model's maximum
+    sequence length; each step writes its slot in place. The per-step forward pass and sampling
+    (repetition penalty, temperature, top-k, top-p) run as one compiled CUDA graph. Each step
+    attends over the full cache with a mask, and batch sizes are bucketed to powers of two, so
+    there is one graph per batch bucket; warmup() compiles all of them before serving. Rows that
+    emitted their stop token are compacted out of the cache whenever the remaining ones fit a
+    smaller batch bucket.
+    """
+
+    SEQ_BUCKET = 64
+
+    def __init__(self, gpt, config, max_batch: int):
+        super().__init__()
+        self.gpt = gpt
+        self.max_batch = max_batch
+        self.stop_token = gpt.stop_audio_token
+        self.temperature = config.temperature
+        self.top_k = min(config.top_k, gpt.mel_head.out_features)
+        self.top_p = config.top_p
+        self.repetition_penalty = config.repetition_penalty
+
+        blocks = gpt.gpt.h
+        self.heads = blocks[0].attn.num_heads
+        self.head_dim = blocks[0].attn.head_dim
+        max_seq = gpt.gpt_inference.config.n_positions
+        self.max_seq = -(-max_seq // self.SEQ_BUCKET) * self.SEQ_BUCKET
+
+        param = next(gpt.gpt.parameters())
+        cache_shape = (len(blocks), max_batch, self.heads, self.max_seq, self.head_dim)
+        self.register_buffer("k_cache", torch.zeros(cache_shape, dtype=param.dtype, device=param.device), persistent=False)
+        self.register_buffer("v_cache", torch.zeros(cache_shape, dtype=param.dtype, device=param.device), persistent=False)
+        self.register_buffer("key_valid", torch.zeros(max_batch, self.max_seq, dtype=torch.bool, device=param.device), persistent=False)
+        self.register_buffer("seen", torch.zeros(max_batch, gpt.mel_head.out_features, dtype=torch.bool, device=param.device), persistent=False)
+        self.register_buffer("done", torch.zeros(max_batch, dtype=torch.bool, device=param.device), persistent=False)
+
+        # One graph per batch bucket
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit, max_batch.bit_length() + 1
+        )
+        self.step = torch.compile(self._step, mode="reduce-overhead", fullgraph=True, dynamic=False)
+
+    def _bucket(self, batch: int) -> int:
+        return min(1 << (batch - 1).bit_length(), self.max_batch)
+
+    @torch.inference_mode()
+    def warmup(self):
+        """Compile and record the step graph for every batch bucket so live requests never recompile."""
+        pos = torch.zeros(1, dtype=torch.long, device=self.k_cache.device)
+        rows = 1
+        while True:
+            tokens = torch.zeros(rows, 1, dtype=torch.long, device=pos.device)
+            self.key_valid[:rows] = True
+            self.seen[:rows] = False
+            self.done[:rows] = False
+            for _ in range(3):  # CUDA graphs are recorded after a couple of eager runs
+                torch.compiler.cudagraph_mark_step_begin()
+                self.step(tokens, pos, pos)
+            if rows == self.max_batch:
+                break
+            rows = self._bucket(rows + 1)
+
+    @torch.inference_mode()
+    def generate(self, prefix_emb, prefix_mask):
+        """Decode audio codes for left-padded prefixes. Returns (batch, steps) codes like HF generate."""
+        gpt = self.gpt
+        batch, prefix_len = prefix_mask.shape
+        rows = self._bucket(batch)
+        device = prefix_emb.device
+
+        # Pad the batch up to its bucket with rows that are done from the start
+        if rows > batch:
+            prefix_emb = torch.cat([prefix_emb, prefix_emb.new_zeros(rows - batch, *prefix_emb.shape[1:])])
+            prefix_mask = torch.cat([prefix_mask, prefix_mask.new_ones(rows - batch, prefix_len)])
+        self.key_valid[:rows] = True
+        self.key_valid[:rows, :prefix_len] = prefix_mask
+        self.seen[:rows] = False
+        self.seen[:rows, [1, gpt.start_audio_token]] = True  # HF penalizes the fake prefix input ids too
+        self.done[:rows] = False
+        self.done[batch:rows] = True
+
+        # Prefill: conditioning + text prefix and the start_audio_token in one pass
+        start = torch.full((rows, 1), gpt.start_audio_token, dtype=torch.long, device=device)
+        start_emb = gpt.mel_embedding(start) + gpt.mel_pos_embedding.get_fixed_embedding(0, device)
+        emb = torch.cat([prefix_emb, start_emb.to(prefix_emb.dtype)], dim=1)
+        span = prefix_len + 1
+        causal = torch.ones(span, span, dtype=torch.bool, device=device).tril()
+        # Padding queries attend to themselves so no row of the mask is empty
+        mask = (causal & self.key_valid[:rows, None, :span]) | torch.eye(span, dtype=torch.bool, device=device)
+        logits = self._forward(emb, torch.arange(span, device=device), mask[:, None])
+        tokens = self._sample(logits[:, -1], rows)
+
+        # Finished rows keep emitting stop tokens, like HF generate pads them
+        codes = torch.full((rows, gpt.max_gen_mel_tokens), self.stop_token, dtype=torch.long, device=device)
+        codes[:, 0] = tokens[:, 0]
+        row_ids = torch.arange(rows, device=device)  # cache row -> output row
+        pos = torch.tensor([span], device=device)
+        step = 1
+        while step < gpt.max_gen_mel_tokens:
+            if step % 16 == 0:
+                active = int((~self.done[:rows]).sum())
+                if active == 0:
+                    break
+                if self._bucket(active) < rows:
+                    tokens, row_ids, rows = self._compact(tokens, row_ids, self._bucket(active), span + step)
+            torch.compiler.cudagraph_mark_step_begin()
+            tokens = self.step(tokens, pos, pos - prefix_len).clone()
+            codes[row_ids, step] = tokens[:, 0]
+            pos += 1
+            step += 1
+        return codes[:batch, :step]
+
+    def _compact(self, tokens, row_ids, rows: int, length: int):
+        """Move unfinished rows to the front of the cache and shrink the batch to `rows`."""
+        done = self.done[: tokens.shape[0]]
+        keep = torch.cat([(~done).nonzero()[:, 0], done.nonzero()[:, 0]])[:rows]
+        self.k_cache[:, :rows, :, :length] = self.k_cache[:, keep, :, :length]
+        self.v_cache[:, :rows, :, :length] = self.v_cache[:, keep, :, :length]
+        self.key_valid[:rows] = self.key_valid[keep]
+        self.seen[:rows] = self.seen[keep]
+        self.done[:rows] = self.done[keep]
+        return tokens[keep], row_ids[keep], rows
+
+    def _step(self, tokens, pos, mel_pos):
+        """Embed one audio token per row, run the GPT over the whole cache and sample the next."""
+        gpt = self.gpt
+        rows = tokens.shape[0]
+        emb = gpt.mel_embedding(tokens) + gpt.mel_pos_embedding.emb(mel_pos)
+        keys = torch.arange(self.max_seq, device=tokens.device)
+        mask = self.key_valid[:rows] & (keys <= pos)
+        logits = self._forward(emb, pos, mask[:, None, None, :])
+        return self._sample(logits[:, -1], rows)
+
+    def _forward(self, emb, pos, mask):
+        """GPT-2 blocks over `emb`, writing keys/values at `pos` and attending over mask.shape[-1] slots."""
+        transformer = self.gpt.gpt
+        rows, length, _ = emb.shape
+        span = mask.shape[-1]
+
+        x = emb
+        for layer, block in enumerate(transformer.h):
+            attn = block.attn
+            q, k, v = attn.c_attn(block.ln_1(x)).split(attn.split_size, dim=2)
+            q, k, v = (t.view(rows, length, self.heads, self.head_dim).transpose(1, 2) for t in (q, k, v))
+            self.k_cache[layer, :rows].index_copy_(2, pos, k.to(self.k_cache.dtype))
+            self.v_cache[layer, :rows].index_copy_(2, pos, v.to(self.v_cache.dtype))
+            out = F.scaled_dot_product_attention(
+                q, self.k_cache[layer, :rows, :, :span].to(q.dtype),
+                self.v_cache[layer, :rows, :, :span].to(q.dtype), attn_mask=mask,
+            )
+            x = x + attn.c_proj(out.transpose(1, 2).reshape(rows, length, -1))
+            x = x + block.mlp(block.ln_2(x))
+        return self.gpt.gpt_inference.lm_head(transformer.ln_f(x))
+
+    def _sample(self, logits, rows: int):
+        """Repetition penalty, temperature, top-k and top-p sampling (same order as HF generate)."""
+        seen = self.seen[:rows]
+        done = self.done[:rows]
+        logits = logits.float()
+
+        penalized = torch.where(logits < 0, logits * self.repetition_penalty, logits / self.repetition_penalty)
+        logits = torch.where(seen, penalized, logits) / self.temperature
+
+        kth = torch.topk(logits, self.top_k, dim=-1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+
+        sorted_logits, sorted_idx = torch.sort(logits, dim=-1)
+        remove = sorted_logits.softmax(dim=-1).cumsum(dim=-1) <= 1 - self.top_p
+        remove[:, -1] = False
+        logits = logits.masked_fill(remove.scatter(1, sorted_idx, remove), float("-inf"))
+
+        # Multinomial sampling without a host sync (exponential race)
+        probs = logits.softmax(dim=-1)
+        tokens = torch.argmax(probs / torch.empty_like(probs).exponential_(1), dim=-1, keepdim=True)
+        tokens = tokens.masked_fill(done[:, None], self.stop_token)
+
+        seen.scatter_(1, tokens, True)
+        done |= tokens[:, 0] == self.stop_token
+        return tokens
+
+
+def _gpt_dtype() -> torch.dtype:
+    """Dtype of the GPT decoder weights (reduced precision on GPU only)."""
+    if XTTS_DEVICE.startswith("cuda"):
+        return getattr(torch, XTTS_DTYPE)
+    return torch.float32
+
+
+def _autocast(enabled: bool = True):
+    """Autocast context matching the GPT dtype; a no-op for FP32 and CPU models."""
+    dtype = _gpt_dtype()
+    return torch.autocast("cuda", dtype=dtype, enabled=enabled and dtype != torch.float32)
+
+
+def _conv1d_to_linear(module: torch.nn.Module):
+    """Swap HF GPT-2 Conv1D layers for equivalent nn.Linear so dynamic quantization covers them."""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            linear = torch.nn.Linear(child.weight.shape[0], child.nf)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def optimize_model(model):
+    """Cast the GPT decoder to FP16/BF16 on GPU, or quantize it to int8 on CPU. The vocoder stays FP32."""
+    if XTTS_DTYPE == "float32":
+        return
+    if XTTS_DEVICE.startswith("cuda"):
+        model.gpt.to(dtype=_gpt_dtype())
+        print(f"GPT decoder running in {XTTS_DTYPE}")
+    else:
+        _conv1d_to_linear(model.gpt.gpt)
+        torch.ao.quantization.quantize_dynamic(model.gpt, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print("GPT decoder quantized to int8")
+
+
+def get_tts():
+    """Lazy load TTS model and start the request pool worker."""
+    global tts_model, request_pool
+    with _tts_lock:
+        if tts_model is None:
+            print(f"Loading XTTS-v2 model on {XTTS_DEVICE}...")
+            tts_model = TTS(
+                model_path=MODEL_DIR,
+                config_path=os.path.join(MODEL_DIR, "config.json"),
+            ).to(XTTS_DEVICE)
+            optimize_model(tts_model.synthesizer.tts_model)
+            request_pool = RequestPool(tts_model)
+            print("XTTS-v2 model loaded!")
+
+            if os.path.exists(DEFAULT_SPEAKER):
+                # Warm up kernels with a short prompt before serving traffic
+                request_pool.submit("Hello.", "en", DEFAULT_SPEAKER).result()
+                print("XTTS-v2 warmed up!")
+            tts_ready.set()
     return tts_model
 
 
+def preload_tts():
+    """Load and warm the model before the first request; requests arriving meanwhile wait in get_tts()."""
+    try:
+        get_tts()
+    except Exception as e:
+        print(f"Error loading XTTS-v2 model: {e}")
+
+
+def _pcm_buffer(samples: int) -> np.ndarray:
+    """Per-thread int16 scratch buffer, grown as needed and reused across requests."""
+    buf = getattr(_scratch, "pcm", None)
+    if buf is None or buf.shape[0] < samples:
+        buf = _scratch.pcm = np.empty(samples, dtype=np.int16)
+    return buf[:samples]
+
+
+def tts_to_bytes(wav: np.ndarray, sample_rate: int) -> bytes:
+    """Encode a float waveform as a 16-bit mono WAV in memory."""
+    peak = max(0.01, float(wav.max()), -float(wav.min()))
+
+    # Scale and cast in one vectorized pass straight into the int16 buffer. Peak
+    # normalization keeps every sample within +/-32767, so no clipping pass is needed.
+    pcm = _pcm_buffer(wav.shape[0])
+    np.multiply(wav, 32767 / peak, out=pcm, casting="unsafe")
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return buf.getvalue()
+
+
+def synthesize(text: str, speaker_wav: str, language: str) -> bytes:
+    """Synthesize text sentence by sentence through the request pool, return WAV bytes."""
+    tts = get_tts()
+
+    futures = [
+        request_pool.submit(sentence, language, speaker_wav)
+        for sentence in tts.synthesizer.split_into_sentences(text)
+    ]
+    silence = np.zeros(SENTENCE_GAP, dtype=np.float32)
+    wav = np.concatenate([part for future in futures for part in (future.result(), silence)])
+    return tts_to_bytes(wav, tts.synthesizer.output_sample_rate)
+
+
 def chat_with_llama(message: str, system_prompt: str = None) -> str:
-    """Send message to Llama 3.1 via Ollama and get response."""
-    url = f"{OLLAMA_URL}/api/generate"
-
-    prompt = message
-    if system_prompt:
-        prompt = f"{system_prompt}\n\nUser: {message}\nAssistant:"
-
-    payload = {
-        "model": LLM_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
+    """Send message to Llama 3.1 via Ollama or llama.cpp and get response."""
+    if LLM_BACKEND == "llamacpp":
+        # Chat endpoint, so the model's chat template ends the reply at the assistant's turn
+        messages = [{"role": "user", "content": message}]
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+
+        url = f"{LLAMACPP_URL}/v1/chat/completions"
+        payload = {
+            "messages": messages,
+            "max_tokens": 150,  # Keep responses short for voice
             "temperature": 0.7,
-            "max_tokens": 150  # Keep responses short for voice
+            "cache_prompt": True,  # Reuse the KV cache of the shared system prompt prefix
+            "stream": False
+        }
+    else:
+        prompt = message
+        if system_prompt:
+            prompt = f"{system_prompt}\n\nUser: {message}\nAssistant:"
+
+        url = f"{OLLAMA_URL}/api/generate"
+        payload = {
+            "model": LLM_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.7,
+                "max_tokens": 150  # Keep responses short for voice
+            }
         }
-    }
 
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = SESSION.post(url, json=payload, timeout=30)
         response.raise_for_status()
-        return response.json().get("response", "")
-    except requests.exceptions.RequestException as e:
-        print(f"Ollama error: {e}")
+        result = response.json()
+        if LLM_BACKEND == "llamacpp":
+            return result["choices"][0]["message"]["content"]
+        return result.get("response", "")
+    except (requests.exceptions.RequestException, KeyError, IndexError) as e:
+        print(f"LLM error: {e}")
         return "I'm sorry, I couldn't process that request."
 
 
@@ -82,12 +776,13 @@ def index():
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check endpoint."""
+    """Health check endpoint. Returns 503 until the model is loaded and warmed up."""
+    ready = tts_ready.is_set()
     return jsonify({
-        "status": "ok",
+        "status": "ok" if ready else "loading",
         "model": "xtts-v2",
         "llm": LLM_MODEL
-    })
+    }), 200 if ready else 503
 
 
 @app.route("/tts", methods=["POST"])
@@ -114,21 +809,10 @@ def text_to_speech():
     language = data.get("language", "en")
 
     try:
-        tts = get_tts()
-
-        # Generate audio to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-            output_path = f.name
-
-        tts.tts_to_file(
-            text=text,
-            file_path=output_path,
-            speaker_wav=speaker_wav,
-            language=language
-        )
+        audio = synthesize(text, speaker_wav, language)
 
         return send_file(
-            output_path,
+            io.BytesIO(audio),
             mimetype="audio/wav",
             as_attachment=True,
             download_name="speech.wav"
@@ -169,20 +853,10 @@ def chat_with_voice():
         print(f"Assistant: {llm_response}")
 
         # Convert to speech
-        tts = get_tts()
-
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-            output_path = f.name
-
-        tts.tts_to_file(
-            text=llm_response,
-            file_path=output_path,
-            speaker_wav=speaker_wav,
-            language="en"
-        )
+        audio = synthesize(llm_response, speaker_wav, "en")
 
         return send_file(
-            output_path,
+            io.BytesIO(audio),
             mimetype="audio/wav",
             as_attachment=True,
             download_name="response.wav"
@@ -224,6 +898,12 @@ def chat_text_only():
         return jsonify({"error": str(e)}), 500
 
 
+if __name__ != "__main__":
+    # Imported by the gunicorn worker: load in the background so the worker keeps
+    # checking in with the arbiter (--timeout) while the model loads and compiles
+    threading.Thread(target=preload_tts, name="xtts-preload", daemon=True).start()
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
     print(f"""
@@ -240,4 +920,15 @@ if __name__ == "__main__":
 ║  LLM Model:  {LLM_MODEL:<20}                        ║
 ╚══════════════════════════════════════════════════════════════╝
 """)
-    app.run(host="0.0.0.0", port=port, debug=False)
+    # One gunicorn worker: the model and request pool live in-process, and concurrent
+    # requests only batch together if they reach the same pool. Threads provide the concurrency.
+    os.execvp("gunicorn", [
+        "gunicorn",
+        "--worker-class", "gthread",
+        "--workers", "1",
+        "--threads", str(THREADS),
+        "--timeout", "120",
+        "--bind", f"0.0.0.0:{port}",
+        "--chdir", MODEL_DIR,
+        "tts_server:app",
+    ])
@@ -4,24 +4,34 @@ AI Hotline Webhook Server
 
 This server handles incoming calls from Twilio/Jambonz and orchestrates:
 1. Speech-to-Text (Whisper)
-2. AI Response (Langflow or direct Ollama/Llama 3.1)
+2. AI Response (Langflow or direct Llama 3.1 via Ollama or llama.cpp)
 3. Text-to-Speech (XTTS-v2)
 
 Endpoints:
 - POST /voice          - Twilio webhook (TwiML)
 - POST /jambonz        - Jambonz webhook
 - POST /gather         - Handle speech input
+- POST /gather-continue - Finish a turn after the filler phrase
 - GET  /health         - Health check
 - GET  /audio/<file>   - Serve generated audio
 """
 
 import os
 import io
+import re
 import json
 import uuid
-import tempfile
-import requests
+import wave
+import asyncio
+import hashlib
+import time
+import threading
+import httpx
+import orjson
+from collections import OrderedDict, deque
+from concurrent.futures import wait
 from pathlib import Path
+from xml.sax.saxutils import escape
 from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 
@@ -33,12 +43,14 @@ CORS(app)
 # =============================================================================
 
 PORT = int(os.getenv("PORT", 8080))
+THREADS = int(os.getenv("THREADS", 64))  # Concurrent webhook/audio requests
 BASE_URL = os.getenv("BASE_URL", f"http://localhost:{PORT}")
 
 # Service URLs
 TTS_URL = os.getenv("TTS_URL", "http://localhost:5000")
 ASR_URL = os.getenv("ASR_URL", "http://localhost:9000")
 LLM_URL = os.getenv("LLM_URL", "http://localhost:11434")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")  # "ollama" or "llamacpp" (llama.cpp llama-server)
 LANGFLOW_URL = os.getenv("LANGFLOW_URL", "http://localhost:7860")
 LANGFLOW_FLOW_ID = os.getenv("LANGFLOW_FLOW_ID", "")  # Set this to use Langflow
 
@@ -46,88 +58,457 @@ LANGFLOW_FLOW_ID = os.getenv("LANGFLOW_FLOW_ID", "")  # Set this to use Langflow
 AUDIO_DIR = Path(os.getenv("AUDIO_DIR", "./audio_cache"))
 AUDIO_DIR.mkdir(exist_ok=True, parents=True)
 
+# Let a front proxy stream audio files instead of this process:
+# USE_X_SENDFILE=1 for Apache/lighttpd X-Sendfile, or ACCEL_REDIRECT_PREFIX=/_protected_audio/
+# for an nginx `internal` location aliased to AUDIO_DIR
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0") == "1"
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "")
+
+# Recently synthesized WAVs kept in memory, since Twilio fetches them right after the TwiML.
+# The fixed phrases are pinned for the life of the process.
+AUDIO_MEM_MAX = int(os.getenv("AUDIO_MEM_MAX", 128))
+AUDIO_MEM = OrderedDict()  # filename -> WAV bytes, least recently used first
+PINNED_AUDIO = {}          # filename -> WAV bytes
+AUDIO_MEM_LOCK = threading.Lock()
+
+# AUDIO_DIR is trimmed to MAX_CACHE_BYTES (least recently used first) by a background sweep
+MAX_CACHE_BYTES = int(os.getenv("MAX_CACHE_BYTES", 1 << 30))
+CACHE_GC_INTERVAL = 60  # seconds
+CACHE_EVENTS = deque()  # (filename, size or None for a reuse) since the last sweep
+
+# Sentences of one AI response synthesized in parallel
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", 3))
+PENDING_AUDIO = {}  # filename -> Task of audio still being synthesized
+
+# Play a filler phrase if the AI response takes longer than this (seconds)
+FILLER_AFTER = float(os.getenv("FILLER_AFTER", 1.5))
+# CallSid -> Future of an AI response still generating after the filler, oldest first. Callers
+# who hang up never fetch theirs, so only the newest HISTORY_CALLS are kept.
+PENDING_TURNS = OrderedDict()
+PENDING_LOCK = threading.Lock()
+
+# Recent turns of each call, sent with every LLM request so the backend can reuse its cached prefix.
+# Only touched on LOOP, so it needs no lock.
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", 6))
+HISTORY_CALLS = int(os.getenv("HISTORY_CALLS", 256))
+CALL_HISTORY = OrderedDict()  # CallSid -> [{"role", "content"}, ...], least recently active first
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+LLM_FALLBACK = "I'm sorry, I had trouble understanding. Could you repeat that?"
+
+# Fixed phrases, synthesized once at startup and then served from the audio cache
+GREETING = "Hello! I'm your AI assistant. How can I help you today?"
+LISTENING = "I'm listening."
+NOT_HEARD = "I didn't catch that. Could you repeat?"
+FAREWELL = "Thank you for calling! Have a great day. Goodbye!"
+JAMBONZ_FAREWELL = "Thank you for calling! Goodbye!"
+FILLER = "One moment."
+CACHED_PHRASES = [GREETING, LISTENING, NOT_HEARD, FAREWELL, JAMBONZ_FAREWELL, FILLER]
+
+# Goodbye intent, matched as substrings in a single case-insensitive scan
+GOODBYE_PHRASES = ["goodbye", "bye", "hang up", "end call", "that's all"]
+JAMBONZ_GOODBYE_PHRASES = ["goodbye", "bye", "hang up", "end call"]
+GOODBYE_RE = re.compile("|".join(map(re.escape, GOODBYE_PHRASES)), re.IGNORECASE)
+JAMBONZ_GOODBYE_RE = re.compile("|".join(map(re.escape, JAMBONZ_GOODBYE_PHRASES)), re.IGNORECASE)
+
 # System prompt for the AI assistant
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", """You are a helpful AI voice assistant.
 Keep your responses brief and conversational - aim for 1-2 sentences.
 You're speaking on a phone call, so be natural and friendly.""")
 
+# Pooled keep-alive HTTP connections to the TTS/ASR/LLM backends, driven by one
+# asyncio loop on a background thread so independent calls overlap
+ASYNC_CLIENT = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    )
+)
+LOOP = asyncio.new_event_loop()
+threading.Thread(target=LOOP.run_forever, name="asyncio", daemon=True).start()
+
+
+def run_async(coro, timeout: float = None):
+    """Run a coroutine on the background loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, LOOP).result(timeout)
+
+
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
 
-def call_tts(text: str, language: str = "en") -> str:
-    """Convert text to speech using XTTS-v2, return audio URL."""
+def audio_filename(text: str, language: str = "en") -> str:
+    """Content-addressed cache filename for a phrase."""
+    key = hashlib.blake2b(f"{language}|{text}".encode(), digest_size=16).hexdigest()
+    return f"{key}.wav"
+
+
+async def call_tts(text: str, language: str = "en") -> str:
+    """Convert text to speech using XTTS-v2 (or the audio cache), return audio URL."""
+    filename = audio_filename(text, language)
+    audio_path = AUDIO_DIR / filename
+    if audio_path.exists():
+        CACHE_EVENTS.append((filename, None))
+        return f"{BASE_URL}/audio/{filename}"
+
+    tmp_path = AUDIO_DIR / f".{uuid.uuid4()}.tmp"
     try:
-        response = requests.post(
+        async with ASYNC_CLIENT.stream(
+            "POST",
             f"{TTS_URL}/tts",
             json={"text": text, "language": language},
             timeout=30
-        )
-        response.raise_for_status()
-
-        # Save audio file
-        audio_id = str(uuid.uuid4())
-        audio_path = AUDIO_DIR / f"{audio_id}.wav"
-        audio_path.write_bytes(response.content)
-
-        return f"{BASE_URL}/audio/{audio_id}.wav"
+        ) as response:
+            response.raise_for_status()
+
+            # Stream audio into a temp file, then publish it to the cache atomically
+            chunks = []
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    f.write(chunk)
+                    chunks.append(chunk)
+            os.replace(tmp_path, audio_path)
+            audio = b"".join(chunks)
+            remember_audio(filename, audio)
+            CACHE_EVENTS.append((filename, len(audio)))
+
+        return f"{BASE_URL}/audio/{filename}"
     except Exception as e:
         print(f"TTS error: {e}")
+        tmp_path.unlink(missing_ok=True)
         return None
 
 
-def call_asr(audio_data: bytes) -> str:
-    """Convert speech to text using Whisper."""
+def remember_audio(filename: str, audio: bytes):
+    """Add a WAV to the in-memory LRU, evicting the least recently used ones."""
+    with AUDIO_MEM_LOCK:
+        AUDIO_MEM[filename] = audio
+        AUDIO_MEM.move_to_end(filename)
+        while len(AUDIO_MEM) > AUDIO_MEM_MAX:
+            AUDIO_MEM.popitem(last=False)
+
+
+def recent_audio(filename: str):
+    """WAV bytes of a pinned phrase or recently synthesized file, or None if only on disk."""
+    with AUDIO_MEM_LOCK:
+        if filename in PINNED_AUDIO:
+            return PINNED_AUDIO[filename]
+        if filename in AUDIO_MEM:
+            AUDIO_MEM.move_to_end(filename)
+            return AUDIO_MEM[filename]
+    return None
+
+
+def submit_tts(text: str, language: str = "en"):
+    """
+    Start synthesizing text in the background. Must be called on LOOP.
+    Returns (audio_url, task); /audio waits for the task if the URL is fetched early.
+    """
+    filename = audio_filename(text, language)
+    task = PENDING_AUDIO.get(filename)
+    if task is None:
+        task = asyncio.ensure_future(call_tts(text, language))
+        PENDING_AUDIO[filename] = task
+        task.add_done_callback(lambda _: PENDING_AUDIO.pop(filename, None))
+    return f"{BASE_URL}/audio/{filename}", task
+
+
+def pre_warm_cache():
+    """Synthesize the fixed phrases so calls never wait on them, and pin them in memory."""
+    async def render_all():
+        # Sent together so the TTS server batches them
+        return await asyncio.gather(*(call_tts(phrase) for phrase in CACHED_PHRASES))
+
+    for phrase, url in zip(CACHED_PHRASES, run_async(render_all())):
+        if url:
+            print(f"[CACHED] {phrase}")
+    pin_cached_phrases()
+
+
+def cached_audio_url(text: str, language: str = "en"):
+    """
+    URL of an already rendered phrase, without calling the TTS server. If it isn't rendered
+    yet, returns None and starts rendering it in the background for later calls.
+    """
+    filename = audio_filename(text, language)
+    if filename in PINNED_AUDIO:
+        return f"{BASE_URL}/audio/{filename}"
+
+    audio_path = AUDIO_DIR / filename
+    if audio_path.exists():
+        if filename in PINNED_FILES:
+            PINNED_AUDIO[filename] = audio_path.read_bytes()
+        return f"{BASE_URL}/audio/{filename}"
+
+    LOOP.call_soon_threadsafe(submit_tts, text, language)
+    return None
+
+
+def pin_cached_phrases():
+    """Keep the already rendered fixed phrases in memory for the life of the process."""
+    for filename in PINNED_FILES:
+        audio_path = AUDIO_DIR / filename
+        if audio_path.exists():
+            PINNED_AUDIO[filename] = audio_path.read_bytes()
+
+
+def scan_audio_cache() -> OrderedDict:
+    """Index of the WAVs in AUDIO_DIR (filename -> size), oldest first. Removes stale temp files."""
+    now = time.time()
+    files = []
+    for path in [*AUDIO_DIR.glob(".*.tmp"), *AUDIO_DIR.glob("*.wav")]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Published or deleted since it was listed
+        if path.suffix == ".tmp":
+            if now - stat.st_mtime > 600:
+                path.unlink(missing_ok=True)
+        else:
+            files.append((stat.st_mtime, path.name, stat.st_size))
+    return OrderedDict((name, size) for _, name, size in sorted(files))
+
+
+def sweep_audio_cache(index: OrderedDict):
+    """Apply queued writes/reuses to the index, then delete least recently used files over MAX_CACHE_BYTES."""
+    while CACHE_EVENTS:
+        filename, size = CACHE_EVENTS.popleft()
+        size = size if size is not None else index.get(filename)
+        if size is not None:
+            index[filename] = size
+            index.move_to_end(filename)
+
+    total = sum(index.values())
+    for filename in list(index):
+        if total <= MAX_CACHE_BYTES:
+            break
+        if filename in PINNED_FILES or filename in PENDING_AUDIO:
+            continue
+        total -= index.pop(filename)
+        (AUDIO_DIR / filename).unlink(missing_ok=True)
+
+
+def audio_cache_gc():
+    index = None
+    while True:
+        try:
+            if index is None:
+                index = scan_audio_cache()  # Retried on the next tick if it fails
+            sweep_audio_cache(index)
+        except Exception as e:
+            print(f"Audio cache GC error: {e}")
+        time.sleep(CACHE_GC_INTERVAL)
+
+
+PINNED_FILES = {audio_filename(phrase) for phrase in CACHED_PHRASES}
+pin_cached_phrases()
+threading.Thread(target=audio_cache_gc, name="audio-cache-gc", daemon=True).start()
+
+
+async def call_asr(audio_data: bytes, sample_rate: int = 16000, codec: str = "wav") -> str:
+    """
+    Convert speech to text using Whisper.
+
+    codec is the format of audio_data: "wav" (a WAV file, uploaded as is), or "pcm16" / "opus"
+    for raw 16-bit mono PCM at sample_rate. 16 kHz PCM goes up raw with encode=false so Whisper
+    skips its ffmpeg decode; "opus" is compressed to 16 kbps Ogg/Opus first (~10x smaller).
+    """
     try:
-        files = {"audio_file": ("audio.wav", audio_data, "audio/wav")}
-        response = requests.post(
+        params = {"task": "transcribe", "language": "en", "output": "txt", "encode": "true"}
+        if codec == "pcm16" and sample_rate == 16000:
+            params["encode"] = "false"  # Whisper's native input format
+            upload = ("audio.pcm", audio_data, "application/octet-stream")
+        elif codec == "pcm16":
+            upload = ("audio.wav", pcm16_to_wav(audio_data, sample_rate), "audio/wav")
+        elif codec == "opus":
+            upload = ("audio.ogg", await pcm16_to_opus(audio_data, sample_rate), "audio/ogg")
+        else:
+            upload = ("audio.wav", audio_data, "audio/wav")
+
+        response = await ASYNC_CLIENT.post(
             f"{ASR_URL}/asr",
-            files=files,
-            data={"task": "transcribe", "language": "en"},
+            params=params,
+            files={"audio_file": upload},
             timeout=30
         )
         response.raise_for_status()
-        return response.json().get("text", "")
+        return response.text.strip()
     except Exception as e:
         print(f"ASR error: {e}")
         return ""
 
 
-def call_llm(message: str, conversation_history: list = None) -> str:
-    """Get AI response from Ollama/Llama 3.1 or Langflow."""
+def pcm16_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap raw 16-bit mono PCM in a WAV header."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return buf.getvalue()
+
+
+async def pcm16_to_opus(pcm: bytes, sample_rate: int) -> bytes:
+    """Encode raw 16-bit mono PCM as 16 kbps Ogg/Opus with ffmpeg."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        "-c:a", "libopus", "-b:a", "16k", "-application", "voip", "-f", "ogg", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    ogg, err = await proc.communicate(pcm)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode().strip()}")
+    return ogg
+
+
+def llm_request(message: str, history: list, stream: bool):
+    """
+    (url, payload) of a chat request for the configured LLM backend.
 
-    # If Langflow flow ID is set, use Langflow
-    if LANGFLOW_FLOW_ID:
-        return call_langflow(message)
+    Each turn resends the system prompt and history unchanged, so the backend only
+    prefills the new tokens: Ollama keeps the model and its KV cache loaded between
+    /api/chat calls, and llama.cpp reuses the matching prefix with cache_prompt.
+    Both apply the model's chat template, so replies end at the assistant's turn.
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": message}
+    ]
+
+    if LLM_BACKEND == "llamacpp":
+        return f"{LLM_URL}/v1/chat/completions", {
+            "messages": messages,
+            "max_tokens": 150,  # Keep responses short
+            "temperature": 0.7,
+            "cache_prompt": True,
+            "stream": stream
+        }
 
-    # Otherwise, use Ollama directly
-    try:
-        prompt = f"{SYSTEM_PROMPT}\n\nUser: {message}\nAssistant:"
+    return f"{LLM_URL}/api/chat", {
+        "model": "llama3.1:8b",
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": "10m",
+        "options": {
+            "temperature": 0.7,
+            "num_predict": 150,  # Keep responses short
+            "num_ctx": 2048
+        }
+    }
 
-        response = requests.post(
-            f"{LLM_URL}/api/generate",
-            json={
-                "model": "llama3.1:8b",
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "num_predict": 150  # Keep responses short
-                }
-            },
-            timeout=60
-        )
+
+def llm_text(chunk: dict) -> str:
+    """Generated text in one streamed LLM chunk."""
+    if LLM_BACKEND == "llamacpp":
+        return ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content") or ""
+    return chunk.get("message", {}).get("content", "")
+
+
+def remember_turn(call_sid: str, message: str, reply: str):
+    """Append a turn to the call's history, keeping the last HISTORY_TURNS turns and HISTORY_CALLS calls."""
+    history = CALL_HISTORY.pop(call_sid, [])
+    history += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+    CALL_HISTORY[call_sid] = history[-2 * HISTORY_TURNS:]
+    while len(CALL_HISTORY) > HISTORY_CALLS:
+        CALL_HISTORY.popitem(last=False)
+
+
+async def llm_token_stream(message: str, history: list):
+    """Yield the text pieces of a streamed chat response (Ollama NDJSON or llama.cpp OpenAI-style SSE)."""
+    url, payload = llm_request(message, history, stream=True)
+
+    async with ASYNC_CLIENT.stream("POST", url, json=payload, timeout=60) as response:
         response.raise_for_status()
-        return response.json().get("response", "I couldn't process that.")
+
+        async for line in response.aiter_lines():
+            if LLM_BACKEND == "llamacpp":
+                if not line.startswith("data: "):
+                    continue
+                line = line[len("data: "):]
+                if line == "[DONE]":
+                    break
+            elif not line:
+                continue
+            chunk = json.loads(line)
+            yield llm_text(chunk)
+            if chunk.get("done") or (chunk.get("choices") or [{}])[0].get("finish_reason"):
+                break
+
+
+async def call_llm_stream(message: str, history: list = None):
+    """Stream the AI response from Ollama/Llama 3.1 or Langflow, yielding one sentence at a time."""
+
+    yielded = False
+
+    # Langflow doesn't stream, split its full response instead
+    if LANGFLOW_FLOW_ID:
+        for sentence in SENTENCE_END.split(await call_langflow(message)):
+            if sentence.strip():
+                yielded = True
+                yield sentence.strip()
+        if not yielded:
+            yield LLM_FALLBACK
+        return
+
+    try:
+        buffer = ""
+        async for piece in llm_token_stream(message, history or []):
+            buffer += piece
+
+            # Flush every complete sentence, keep the partial one buffered
+            *sentences, buffer = SENTENCE_END.split(buffer)
+            for sentence in sentences:
+                if sentence.strip():
+                    yielded = True
+                    yield sentence.strip()
+
+        if buffer.strip():
+            yielded = True
+            yield buffer.strip()
     except Exception as e:
         print(f"LLM error: {e}")
-        return "I'm sorry, I had trouble understanding. Could you repeat that?"
 
+    if not yielded:
+        yield LLM_FALLBACK
+
+
+async def speak_llm_response(message: str, call_sid: str):
+    """
+    Get the AI response, in the context of the call so far, and synthesize each sentence
+    while the rest is still generating. Without a call_sid the turn has no history.
+
+    Returns (response_text, audio_urls). audio_urls is None if the first sentence couldn't be
+    synthesized; later sentences may still be rendering and are served by /audio once ready.
+    """
+    slots = asyncio.Semaphore(TTS_CONCURRENCY)
+    sentences = []
+    audio = []
+
+    history = CALL_HISTORY.get(call_sid) if call_sid else None
+    async for sentence in call_llm_stream(message, history):
+        await slots.acquire()
+        url, task = submit_tts(sentence)
+        task.add_done_callback(lambda _: slots.release())
+        sentences.append(sentence)
+        audio.append((url, task))
 
-def call_langflow(message: str) -> str:
+    if call_sid and sentences != [LLM_FALLBACK]:
+        remember_turn(call_sid, message, " ".join(sentences))
+
+    if not audio or not await audio[0][1]:
+        return " ".join(sentences), None
+    return " ".join(sentences), [url for url, _ in audio]
+
+
+async def call_langflow(message: str) -> str:
     """Get AI response from Langflow workflow."""
     try:
-        response = requests.post(
+        response = await ASYNC_CLIENT.post(
             f"{LANGFLOW_URL}/api/v1/run/{LANGFLOW_FLOW_ID}",
             json={
                 "input_value": message,
@@ -149,6 +530,119 @@ def call_langflow(message: str) -> str:
         return "I'm having trouble with my AI workflow. Please try again."
 
 
+# =============================================================================
+# RESPONSE TEMPLATES
+# =============================================================================
+# Everything but the audio URLs and AI text is fixed, so responses are prebuilt as
+# bytes with %b slots (fixed text already XML-escaped) or serialized once with orjson.
+
+def _xml(text: str) -> str:
+    """Escape fixed text for a bytes %-template."""
+    return escape(text).replace("%", "%%")
+
+
+def _twiml(body: str) -> bytes:
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+{body}
+</Response>""".encode()
+
+
+_TWILIO_GATHER = f"""    <Gather input="speech" action="{_xml(BASE_URL)}/gather" method="POST"
+            speechTimeout="auto" language="en-US\""""
+_TWILIO_GREETING_GATHER = f"""{_TWILIO_GATHER}>
+        %b
+    </Gather>
+    <Say>I didn't hear anything. Goodbye!</Say>
+    <Hangup/>"""
+_TWILIO_NEXT_TURN = f"""{_TWILIO_GATHER}/>
+    <Say>Are you still there?</Say>
+    <Hangup/>"""
+
+TWIML_GREETING = _twiml(f"""    %b
+{_TWILIO_GREETING_GATHER}""")
+TWIML_NOT_HEARD = _twiml(f"""    %b
+{_TWILIO_GATHER}/>
+    <Say>Still nothing. Goodbye!</Say>
+    <Hangup/>""")
+TWIML_FAREWELL = _twiml("""    %b
+    <Hangup/>""")
+TWIML_FILLER = _twiml(f"""    <Play>%b</Play>
+    <Redirect method="POST">{_xml(BASE_URL)}/gather-continue</Redirect>""")
+TWIML_RESPONSE_PLAY = _twiml(f"""%b
+{_TWILIO_NEXT_TURN}""")
+TWIML_RESPONSE_SAY = _twiml(f"""    <Say voice="alice">%b</Say>
+{_TWILIO_NEXT_TURN}""")
+TWIML_PLAY = b"    <Play>%b</Play>"
+TWIML_SAY = b"<Say>%b</Say>"
+TWIML_SAY_ALICE = b'<Say voice="alice">%b</Say>'
+
+JAMBONZ_GATHER = {
+    "verb": "gather",
+    "input": ["speech"],
+    "actionHook": f"{BASE_URL}/jambonz-gather",
+    "timeout": 10
+}
+JAMBONZ_HANGUP = {"verb": "hangup"}
+JAMBONZ_GREETING_TAIL = [
+    {
+        "verb": "gather",
+        "input": ["speech"],
+        "actionHook": f"{BASE_URL}/jambonz-gather",
+        "timeout": 10,
+        "speechTimeout": "auto",
+        "recognizer": {
+            "vendor": "google",
+            "language": "en-US"
+        }
+    },
+    {
+        "verb": "say",
+        "text": "I didn't hear anything. Goodbye!"
+    },
+    JAMBONZ_HANGUP
+]
+JAMBONZ_GREETING_SAY = orjson.dumps([
+    {
+        "verb": "say",
+        "text": GREETING,
+        "synthesizer": {
+            "vendor": "google",
+            "language": "en-US",
+            "voice": "en-US-Wavenet-D"
+        }
+    },
+    *JAMBONZ_GREETING_TAIL
+])
+
+
+def twiml_phrase(text: str, say: bytes = TWIML_SAY_ALICE) -> bytes:
+    """<Play> of a fixed phrase's rendered audio, or a Twilio <Say> until it's rendered."""
+    audio_url = cached_audio_url(text)
+    if audio_url:
+        return b"<Play>%b</Play>" % escape(audio_url).encode()
+    return say % escape(text).encode()
+
+
+def jambonz_phrase(text: str) -> dict:
+    """Play verb of a fixed phrase's rendered audio, or a say verb until it's rendered."""
+    audio_url = cached_audio_url(text)
+    if audio_url:
+        return {"verb": "play", "url": audio_url}
+    return {"verb": "say", "text": text}
+
+
+def twiml_response(twiml: bytes) -> Response:
+    return Response(twiml, mimetype="text/xml")
+
+
+def jambonz_response(verbs) -> Response:
+    """Jambonz verbs as JSON; `verbs` is a list or already-serialized bytes."""
+    if not isinstance(verbs, bytes):
+        verbs = orjson.dumps(verbs)
+    return Response(verbs, mimetype="application/json")
+
+
 # =============================================================================
 # TWILIO ENDPOINTS (TwiML)
 # =============================================================================
@@ -179,35 +673,8 @@ def twilio_voice():
 
     print(f"[INCOMING CALL] SID: {call_sid}, From: {from_number}")
 
-    # Generate greeting audio
-    greeting = "Hello! I'm your AI assistant. How can I help you today?"
-    audio_url = call_tts(greeting)
-
-    if audio_url:
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Play>{audio_url}</Play>
-    <Gather input="speech" action="{BASE_URL}/gather" method="POST"
-            speechTimeout="auto" language="en-US">
-        <Say>I'm listening.</Say>
-    </Gather>
-    <Say>I didn't hear anything. Goodbye!</Say>
-    <Hangup/>
-</Response>"""
-    else:
-        # Fallback to Twilio's TTS
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">{greeting}</Say>
-    <Gather input="speech" action="{BASE_URL}/gather" method="POST"
-            speechTimeout="auto" language="en-US">
-        <Say>I'm listening.</Say>
-    </Gather>
-    <Say>I didn't hear anything. Goodbye!</Say>
-    <Hangup/>
-</Response>"""
-
-    return Response(twiml, mimetype="text/xml")
+    # Pre-rendered greeting, falling back to Twilio's TTS if it isn't rendered yet
+    return twiml_response(TWIML_GREETING % (twiml_phrase(GREETING), twiml_phrase(LISTENING, TWIML_SAY)))
 
 
 @app.route("/gather", methods=["POST"])
@@ -217,68 +684,53 @@ def twilio_gather():
     Process through ASR -> LLM -> TTS and respond.
     """
     speech_result = request.form.get("SpeechResult", "")
-    call_sid = request.form.get("CallSid", "unknown")
+    call_sid = request.form.get("CallSid")  # None: no history or filler redirect for this turn
 
     print(f"[SPEECH INPUT] SID: {call_sid}, Text: {speech_result}")
 
     if not speech_result:
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">I didn't catch that. Could you repeat?</Say>
-    <Gather input="speech" action="{BASE_URL}/gather" method="POST"
-            speechTimeout="auto" language="en-US"/>
-    <Say>Still nothing. Goodbye!</Say>
-    <Hangup/>
-</Response>"""
-        return Response(twiml, mimetype="text/xml")
+        return twiml_response(TWIML_NOT_HEARD % twiml_phrase(NOT_HEARD))
 
     # Check for goodbye intent
-    goodbye_phrases = ["goodbye", "bye", "hang up", "end call", "that's all"]
-    if any(phrase in speech_result.lower() for phrase in goodbye_phrases):
-        farewell = "Thank you for calling! Have a great day. Goodbye!"
-        audio_url = call_tts(farewell)
+    if GOODBYE_RE.search(speech_result):
+        return twiml_response(TWIML_FAREWELL % twiml_phrase(FAREWELL))
 
-        if audio_url:
-            twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Play>{audio_url}</Play>
-    <Hangup/>
-</Response>"""
-        else:
-            twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">{farewell}</Say>
-    <Hangup/>
-</Response>"""
-        return Response(twiml, mimetype="text/xml")
+    # Get AI response, speaking each sentence as soon as it's synthesized
+    turn = asyncio.run_coroutine_threadsafe(speak_llm_response(speech_result, call_sid), LOOP)
+    filler_url = cached_audio_url(FILLER)
 
-    # Get AI response
-    ai_response = call_llm(speech_result)
-    print(f"[AI RESPONSE] {ai_response}")
+    if call_sid and filler_url and not wait([turn], timeout=FILLER_AFTER).done:
+        # Play the filler now and pick up the response on the redirect
+        with PENDING_LOCK:
+            PENDING_TURNS[call_sid] = turn
+            PENDING_TURNS.move_to_end(call_sid)
+            while len(PENDING_TURNS) > HISTORY_CALLS:
+                PENDING_TURNS.popitem(last=False)
+        return twiml_response(TWIML_FILLER % escape(filler_url).encode())
 
-    # Convert to speech
-    audio_url = call_tts(ai_response)
+    return twiml_response(response_twiml(*turn.result()))
 
-    if audio_url:
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Play>{audio_url}</Play>
-    <Gather input="speech" action="{BASE_URL}/gather" method="POST"
-            speechTimeout="auto" language="en-US"/>
-    <Say>Are you still there?</Say>
-    <Hangup/>
-</Response>"""
-    else:
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">{ai_response}</Say>
-    <Gather input="speech" action="{BASE_URL}/gather" method="POST"
-            speechTimeout="auto" language="en-US"/>
-    <Say>Are you still there?</Say>
-    <Hangup/>
-</Response>"""
 
-    return Response(twiml, mimetype="text/xml")
+@app.route("/gather-continue", methods=["POST"])
+def twilio_gather_continue():
+    """Finish a turn whose AI response was still generating when the filler was played."""
+    call_sid = request.form.get("CallSid")
+    with PENDING_LOCK:
+        turn = PENDING_TURNS.pop(call_sid, None)
+
+    if turn is None:
+        return twiml_response(response_twiml(LLM_FALLBACK, None))
+    return twiml_response(response_twiml(*turn.result()))
+
+
+def response_twiml(ai_response: str, audio_urls: list) -> bytes:
+    """TwiML speaking an AI response and gathering the caller's next turn."""
+    print(f"[AI RESPONSE] {ai_response}")
+
+    if audio_urls:
+        plays = b"\n".join(TWIML_PLAY % escape(url).encode() for url in audio_urls)
+        return TWIML_RESPONSE_PLAY % plays
+    return TWIML_RESPONSE_SAY % escape(ai_response).encode()
 
 
 # =============================================================================
@@ -297,109 +749,41 @@ def jambonz_webhook():
 
     print(f"[JAMBONZ CALL] SID: {call_sid}, From: {from_number}")
 
-    # Generate greeting
-    greeting = "Hello! I'm your AI assistant. How can I help you today?"
-    audio_url = call_tts(greeting)
-
-    response = []
+    # Pre-rendered greeting, falling back to Google TTS if it isn't rendered yet
+    audio_url = cached_audio_url(GREETING)
 
     if audio_url:
-        response.append({
-            "verb": "play",
-            "url": audio_url
-        })
-    else:
-        response.append({
-            "verb": "say",
-            "text": greeting,
-            "synthesizer": {
-                "vendor": "google",
-                "language": "en-US",
-                "voice": "en-US-Wavenet-D"
-            }
-        })
-
-    # Gather speech input
-    response.append({
-        "verb": "gather",
-        "input": ["speech"],
-        "actionHook": f"{BASE_URL}/jambonz-gather",
-        "timeout": 10,
-        "speechTimeout": "auto",
-        "recognizer": {
-            "vendor": "google",
-            "language": "en-US"
-        }
-    })
-
-    response.append({
-        "verb": "say",
-        "text": "I didn't hear anything. Goodbye!"
-    })
-
-    response.append({"verb": "hangup"})
-
-    return jsonify(response)
+        return jambonz_response([{"verb": "play", "url": audio_url}, *JAMBONZ_GREETING_TAIL])
+    return jambonz_response(JAMBONZ_GREETING_SAY)
 
 
 @app.route("/jambonz-gather", methods=["POST"])
 def jambonz_gather():
     """Handle speech input from Jambonz gather verb."""
     payload = request.json or {}
+    call_sid = payload.get("call_sid")  # None: no history for this turn
     speech = payload.get("speech", {})
     speech_text = speech.get("alternatives", [{}])[0].get("transcript", "")
 
     print(f"[JAMBONZ SPEECH] Text: {speech_text}")
 
     if not speech_text:
-        return jsonify([
-            {"verb": "say", "text": "I didn't catch that. Could you repeat?"},
-            {
-                "verb": "gather",
-                "input": ["speech"],
-                "actionHook": f"{BASE_URL}/jambonz-gather",
-                "timeout": 10
-            },
-            {"verb": "hangup"}
-        ])
+        return jambonz_response([jambonz_phrase(NOT_HEARD), JAMBONZ_GATHER, JAMBONZ_HANGUP])
 
     # Check for goodbye
-    goodbye_phrases = ["goodbye", "bye", "hang up", "end call"]
-    if any(phrase in speech_text.lower() for phrase in goodbye_phrases):
-        farewell = "Thank you for calling! Goodbye!"
-        audio_url = call_tts(farewell)
-
-        if audio_url:
-            return jsonify([
-                {"verb": "play", "url": audio_url},
-                {"verb": "hangup"}
-            ])
-        return jsonify([
-            {"verb": "say", "text": farewell},
-            {"verb": "hangup"}
-        ])
-
-    # Get AI response
-    ai_response = call_llm(speech_text)
-    audio_url = call_tts(ai_response)
-
-    response = []
+    if JAMBONZ_GOODBYE_RE.search(speech_text):
+        return jambonz_response([jambonz_phrase(JAMBONZ_FAREWELL), JAMBONZ_HANGUP])
 
-    if audio_url:
-        response.append({"verb": "play", "url": audio_url})
-    else:
-        response.append({"verb": "say", "text": ai_response})
+    # Get AI response, speaking each sentence as soon as it's synthesized
+    ai_response, audio_urls = run_async(speak_llm_response(speech_text, call_sid))
 
-    response.append({
-        "verb": "gather",
-        "input": ["speech"],
-        "actionHook": f"{BASE_URL}/jambonz-gather",
-        "timeout": 10
-    })
-
-    response.append({"verb": "hangup"})
+    if audio_urls:
+        response = [{"verb": "play", "url": url} for url in audio_urls]
+    else:
+        response = [{"verb": "say", "text": ai_response}]
+    response += [JAMBONZ_GATHER, JAMBONZ_HANGUP]
 
-    return jsonify(response)
+    return jambonz_response(response)
 
 
 # =============================================================================
@@ -409,10 +793,32 @@ def jambonz_gather():
 @app.route("/audio/<filename>", methods=["GET"])
 def serve_audio(filename):
     """Serve generated audio files."""
+    # Audio of later sentences may still be synthesizing when Twilio asks for it
+    pending = PENDING_AUDIO.get(filename)
+    if pending is not None:
+        run_async(asyncio.wait([pending], timeout=60))
+
+    audio = recent_audio(filename)
     audio_path = AUDIO_DIR / filename
-    if audio_path.exists():
-        return send_file(audio_path, mimetype="audio/wav")
-    return jsonify({"error": "Audio not found"}), 404
+    if audio is None and not audio_path.exists():
+        return jsonify({"error": "Audio not found"}), 404
+
+    if ACCEL_REDIRECT_PREFIX:
+        if not audio_path.is_file():
+            return jsonify({"error": "Audio not found"}), 404
+        return Response(headers={
+            "X-Accel-Redirect": f"{ACCEL_REDIRECT_PREFIX}{filename}",
+            "Content-Type": "audio/wav"
+        })
+
+    # Filenames are content hashes, so the name doubles as a strong ETag
+    return send_file(
+        io.BytesIO(audio) if audio is not None else audio_path,
+        mimetype="audio/wav",
+        conditional=True,
+        etag=audio_path.stem,
+        max_age=86400
+    )
 
 
 # =============================================================================
@@ -427,6 +833,7 @@ if __name__ == "__main__":
 ║  Endpoints:                                                   ║
 ║    POST /voice         - Twilio webhook                      ║
 ║    POST /gather        - Twilio speech handler               ║
+║    POST /gather-continue - Twilio response after filler      ║
 ║    POST /jambonz       - Jambonz webhook                     ║
 ║    POST /jambonz-gather- Jambonz speech handler              ║
 ║    GET  /health        - Health check                        ║
@@ -441,4 +848,17 @@ if __name__ == "__main__":
 ║  Running on: http://0.0.0.0:{PORT:<5}                             ║
 ╚══════════════════════════════════════════════════════════════╝
 """)
-    app.run(host="0.0.0.0", port=PORT, debug=False)
+    pre_warm_cache()
+
+    # One gthread worker: pending audio and filler turns are tracked in-process, and backend
+    # calls run on this process's asyncio loop thread (which rules out gevent monkey-patching)
+    os.execvp("gunicorn", [
+        "gunicorn",
+        "--worker-class", "gthread",
+        "--workers", "1",
+        "--threads", str(THREADS),
+        "--timeout", "120",
+        "--bind", f"0.0.0.0:{PORT}",
+        "--pythonpath", os.path.dirname(os.path.abspath(__file__)),
+        "hotline_server:app",
+    ])